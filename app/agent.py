@@ -1,24 +1,70 @@
-from typing import Dict, Any, Optional, List
+import ahocorasick
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, Any, Optional, List
 from .groq_client import groq_client
 from .knowledge_graph import knowledge_graph
 
+logger = logging.getLogger(__name__)
+
+# Simple keyword-based preference extraction
+PREFERENCES = {
+    "electronics": ["phone", "laptop", "computer", "gadget", "tech"],
+    "clothing": ["shirt", "dress", "shoes", "jacket", "fashion"],
+    "books": ["book", "novel", "reading", "author"],
+    "sports": ["fitness", "exercise", "sports", "workout"]
+}
+
+def _build_preference_matcher() -> ahocorasick.Automaton:
+    """Build a single automaton matching every preference keyword."""
+    automaton = ahocorasick.Automaton()
+    for category, keywords in PREFERENCES.items():
+        for rank, keyword in enumerate(keywords):
+            automaton.add_word(keyword.casefold(), (category, rank, keyword))
+    automaton.make_automaton()
+    return automaton
+
+_PREFERENCE_MATCHER = _build_preference_matcher()
+
+# Number of past messages forwarded to the LLM
+MAX_HISTORY = 10
+
+# Number of messages kept per user, and number of users tracked in memory
+HISTORY_MAXLEN = 20
+MAX_TRACKED_USERS = 10_000
+
 class ECommerceAgent:
     """AI-powered shopping assistant agent."""
     
     def __init__(self):
-        self.conversation_history: List[Dict[str, str]] = []
+        self.histories: "OrderedDict[str, Deque[Dict[str, str]]]" = OrderedDict()
         self.current_user_id: Optional[str] = None
+        # Strong references to fire-and-forget tasks so they are not collected mid-flight
+        self._background_tasks: set = set()
+    
+    def _get_history(self, user_id: str) -> Deque[Dict[str, str]]:
+        """Get the bounded history for a user, evicting the least recently used."""
+        history = self.histories.get(user_id)
+        if history is None:
+            history = self.histories[user_id] = deque(maxlen=HISTORY_MAXLEN)
+            if len(self.histories) > MAX_TRACKED_USERS:
+                self.histories.popitem(last=False)
+        else:
+            self.histories.move_to_end(user_id)
+        return history
     
     async def initialize(self):
         """Initialize the agent and establish connections."""
         # Connect to Neo4j
         await knowledge_graph.connect()
         
-        # Verify Groq client configuration
+        # Open the Groq connection pool and verify its configuration
+        await groq_client.startup()
         if not groq_client.is_configured():
-            print("⚠️  Warning: Groq API not properly configured")
+            logger.warning("Groq API not properly configured")
         else:
-            print("✅ Groq client configured successfully")
+            logger.info("Groq client configured successfully")
     
     async def process_message(
         self, 
@@ -39,94 +85,157 @@ class ECommerceAgent:
         """
         self.current_user_id = user_id
         
+        # Start the profile read first and do the in-memory prep while it is in flight
+        profile_task = asyncio.create_task(knowledge_graph.get_user_profile(user_id))
+        
+        history = self._get_history(user_id)
+        
+        # Prior turns are sent as structured messages ahead of the new one
+        recent_messages = list(history)[-MAX_HISTORY:]
+        
         # Add message to conversation history
-        self.conversation_history.append({
+        user_turn = {
             "role": "user",
             "content": user_message
-        })
-        
-        # Get user profile from knowledge graph
-        user_profile = await knowledge_graph.get_user_profile(user_id)
-        
-        # Generate context from conversation history
-        conversation_context = self._build_conversation_context()
+        }
+        history.append(user_turn)
         
-        # Combine context
-        full_context = f"{context}\n{conversation_context}" if context else conversation_context
+        # Extract and store user preferences (placeholder logic) without blocking the reply
+        self._spawn(self._extract_and_store_preferences(user_message, user_id))
         
+        completed = False
         try:
+            # Get user profile from knowledge graph
+            user_profile = await profile_task
+            
             # Generate response using Groq API
             agent_response = await groq_client.generate_agent_response(
                 user_message=user_message,
-                context=full_context,
-                user_profile=user_profile
+                context=context,
+                user_profile=user_profile,
+                history=recent_messages,
+                user_id=user_id,
+                profile_version=knowledge_graph.profile_version(user_id)
             )
             
             # Add agent response to conversation history
-            self.conversation_history.append({
+            history.append({
                 "role": "assistant",
                 "content": agent_response
             })
-            
-            # Extract and store user preferences (placeholder logic)
-            await self._extract_and_store_preferences(user_message, user_id)
+            completed = True
             
             return {
                 "response": agent_response,
                 "user_id": user_id,
                 "user_profile": user_profile,
-                "conversation_length": len(self.conversation_history),
+                "conversation_length": len(history),
                 "timestamp": self._get_timestamp()
             }
             
         except Exception as e:
+            # Error text is returned to the client but never recorded as a turn
+            self._discard_turn(history, user_turn)
             error_response = f"I apologize, but I encountered an error: {str(e)}"
             return {
                 "response": error_response,
                 "user_id": user_id,
                 "error": str(e),
+                "conversation_length": len(history),
                 "timestamp": self._get_timestamp()
             }
+        finally:
+            if not completed:
+                self._discard_turn(history, user_turn)
     
-    def _build_conversation_context(self) -> str:
-        """Build context from recent conversation history."""
-        if len(self.conversation_history) <= 2:
-            return ""
+    async def stream_message(
+        self, 
+        user_message: str, 
+        user_id: str = "default_user",
+        context: str = ""
+    ) -> AsyncIterator[str]:
+        """
+        Process a user message and stream the response as it is generated.
         
-        # Get last few exchanges for context
-        recent_messages = self.conversation_history[-6:]  # Last 3 exchanges
-        context_parts = []
+        Args:
+            user_message: The user's input message
+            user_id: Unique identifier for the user
+            context: Additional context for the conversation
+            
+        Yields:
+            Text deltas of the agent's response
+        """
+        self.current_user_id = user_id
+        
+        profile_task = asyncio.create_task(knowledge_graph.get_user_profile(user_id))
+        
+        history = self._get_history(user_id)
+        recent_messages = list(history)[-MAX_HISTORY:]
+        user_turn = {
+            "role": "user",
+            "content": user_message
+        }
+        history.append(user_turn)
         
-        for msg in recent_messages:
-            role = "User" if msg["role"] == "user" else "Assistant"
-            context_parts.append(f"{role}: {msg['content']}")
+        self._spawn(self._extract_and_store_preferences(user_message, user_id))
         
-        return "\n".join(context_parts)
+        parts = []
+        completed = False
+        try:
+            # Inside the try so a disconnect during the profile read still drops the turn
+            user_profile = await profile_task
+            
+            async for delta in groq_client.stream_agent_response(
+                user_message=user_message,
+                context=context,
+                user_profile=user_profile,
+                history=recent_messages,
+                user_id=user_id,
+                profile_version=knowledge_graph.profile_version(user_id)
+            ):
+                parts.append(delta)
+                yield delta
+            completed = True
+        except Exception as e:
+            # Shown to the client only; error text is never replayed to the model
+            yield f"I apologize, but I encountered an error: {str(e)}"
+        finally:
+            # Also runs when the client disconnects mid-stream (GeneratorExit at yield)
+            if completed:
+                history.append({
+                    "role": "assistant",
+                    "content": "".join(parts)
+                })
+            else:
+                self._discard_turn(history, user_turn)
+    
+    def _discard_turn(self, history: Deque[Dict[str, str]], turn: Dict[str, str]):
+        """Drop an unanswered user turn so history keeps alternating user/assistant."""
+        if history and history[-1] is turn:
+            history.pop()
+    
+    def _spawn(self, coro):
+        """Run a coroutine in the background, keeping a reference until it finishes."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
     async def _extract_and_store_preferences(self, user_message: str, user_id: str):
         """Extract user preferences from messages and store in knowledge graph."""
         # This is a placeholder implementation
         # In a real system, you would use NLP to extract preferences
         
-        # Simple keyword-based preference extraction
-        preferences = {
-            "electronics": ["phone", "laptop", "computer", "gadget", "tech"],
-            "clothing": ["shirt", "dress", "shoes", "jacket", "fashion"],
-            "books": ["book", "novel", "reading", "author"],
-            "sports": ["fitness", "exercise", "sports", "workout"]
-        }
+        # Keep the first listed keyword found for each category
+        best: Dict[str, tuple] = {}
+        for _, (category, rank, keyword) in _PREFERENCE_MATCHER.iter(user_message.casefold()):
+            if category not in best or rank < best[category][0]:
+                best[category] = (rank, keyword)
+        
+        hits = [(category, best[category][1]) for category in PREFERENCES if category in best]
         
-        user_message_lower = user_message.lower()
-        
-        for category, keywords in preferences.items():
-            for keyword in keywords:
-                if keyword in user_message_lower:
-                    await knowledge_graph.add_user_preference(
-                        user_id=user_id,
-                        category=category,
-                        preference=keyword
-                    )
-                    break
+        # Store all matches in a single round-trip
+        if hits:
+            await knowledge_graph.add_user_preferences_batch(user_id, hits)
     
     async def get_user_recommendations(self, user_id: str) -> List[Dict[str, Any]]:
         """Get personalized recommendations for the user."""
@@ -136,13 +245,14 @@ class ECommerceAgent:
         """Create or update a user profile."""
         return await knowledge_graph.create_or_update_user_profile(user_id, profile_data)
     
-    def get_conversation_history(self) -> List[Dict[str, str]]:
-        """Get the current conversation history."""
-        return self.conversation_history.copy()
+    def get_conversation_history(self, user_id: str) -> List[Dict[str, str]]:
+        """Get the conversation history for a user."""
+        history = self.histories.get(user_id)
+        return list(history) if history else []
     
-    def clear_conversation_history(self):
-        """Clear the conversation history."""
-        self.conversation_history.clear()
+    def clear_conversation_history(self, user_id: str):
+        """Clear the conversation history for a user."""
+        self.histories.pop(user_id, None)
     
     def _get_timestamp(self) -> str:
         """Get current timestamp as string."""
@@ -151,7 +261,11 @@ class ECommerceAgent:
     
     async def cleanup(self):
         """Clean up resources."""
+        # Let pending preference writes finish before closing the driver
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
         await knowledge_graph.close()
+        await groq_client.close()
 
 # Create global agent instance
 agent = ECommerceAgent()
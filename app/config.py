@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     # Groq API Configuration
     GROQ_API_KEY: str = os.getenv("GROQ_API_KEY", "")
     GROQ_MODEL: str = os.getenv("GROQ_MODEL", "llama3-8b-8192")  # LLaMA 3 8B model via Groq
+    GROQ_TEMPERATURE: float = float(os.getenv("GROQ_TEMPERATURE", "0.7"))  # <= 0.2 enables response caching
     
     # SerpApi Configuration
     SERP_API_KEY: str = os.getenv("SERP_API_KEY", "")
@@ -19,11 +20,13 @@ class Settings(BaseSettings):
     NEO4J_URI: str = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     NEO4J_USER: str = os.getenv("NEO4J_USER", "neo4j")
     NEO4J_PASSWORD: str = os.getenv("NEO4J_PASSWORD", "password")
+    NEO4J_DATABASE: str = os.getenv("NEO4J_DATABASE", "neo4j")
     
     # Application Configuration
     APP_NAME: str = "Agent-Powered E-Commerce"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))  # Worker processes when DEBUG is off; opt in to >1
     
     # API Configuration
     API_PREFIX: str = "/api/v1"
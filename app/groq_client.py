@@ -1,8 +1,53 @@
-from groq import Groq
-import json
-from typing import Dict, Any, Optional
+from cachetools import LRUCache, TTLCache
+from groq import AsyncGroq
+import asyncio
+import hashlib
+import httpx
+import logging
+import orjson
+from typing import AsyncIterator, Dict, Any, Optional, List
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
+# Kept byte-identical across requests so the prompt prefix stays cache-eligible
+SYSTEM_PROMPT = """You are an AI-powered shopping assistant for an e-commerce platform. 
+Your role is to help users find products, answer questions, and provide personalized recommendations.
+
+Guidelines:
+- Be helpful, friendly, and professional
+- Ask clarifying questions when needed
+- Provide specific product recommendations when possible
+- Consider user preferences and past behavior
+- Suggest related products or alternatives
+"""
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Only near-deterministic completions are worth replaying from the cache
+CACHEABLE_MAX_TEMPERATURE = 0.2
+
+# Completion requests arriving within this window are dispatched together
+BATCH_WINDOW_MS = 5
+MAX_BATCH = 32
+
+# Serialized profiles keyed by (user_id, profile version)
+_PROFILE_JSON_CACHE: LRUCache = LRUCache(maxsize=2048)
+
+def _serialize_profile(user_profile: Dict[str, Any], user_id: Optional[str], version: int) -> str:
+    """Serialize a profile compactly, reusing the last result for the same version."""
+    if user_id is None:
+        return orjson.dumps(user_profile, option=orjson.OPT_SORT_KEYS).decode()
+    
+    key = (user_id, version)
+    cached = _PROFILE_JSON_CACHE.get(key)
+    # Also require the same dict object, in case it was reloaded under the same version
+    if cached is not None and cached[0] is user_profile:
+        return cached[1]
+    
+    serialized = orjson.dumps(user_profile, option=orjson.OPT_SORT_KEYS).decode()
+    _PROFILE_JSON_CACHE[key] = (user_profile, serialized)
+    return serialized
+
 class GroqClient:
     """Client for interacting with Groq API to access LLaMA models."""
     
@@ -10,17 +55,118 @@ class GroqClient:
         self.api_key = settings.GROQ_API_KEY
         self.model = settings.GROQ_MODEL
         self.client = None
+        self._resp_cache: TTLCache = TTLCache(maxsize=5000, ttl=900)
+        # Created lazily, on the running event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher_task: Optional[asyncio.Task] = None
+        self._batch_tasks: set = set()
+        # Created in startup(), once an event loop is running
+        self._http: Optional[httpx.AsyncClient] = None
+    
+    async def startup(self):
+        """Create the shared HTTP/2 connection pool and the Groq client on top of it."""
+        if not self.api_key or self._http is not None:
+            return
+        
+        # One long-lived HTTP/2 pool so TLS sessions and DNS lookups are reused across turns
+        self._http = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+            timeout=httpx.Timeout(30.0, connect=5.0)
+        )
+        self.client = AsyncGroq(api_key=self.api_key, http_client=self._http)
+    
+    async def _submit(self, **request: Any):
+        """Queue a completion request for the dispatcher and wait for its result."""
+        loop = asyncio.get_running_loop()
+        task = self._dispatcher_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._dispatcher_task = asyncio.create_task(self._dispatcher())
+        
+        future = loop.create_future()
+        await self._queue.put((request, future))
+        return await future
+    
+    async def _dispatcher(self):
+        """Drain queued requests in micro-batches and fire each batch concurrently."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + BATCH_WINDOW_MS / 1000
+            
+            try:
+                while len(batch) < MAX_BATCH:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Requests already taken off the queue would otherwise never resolve
+                self._fail_pending(batch)
+                raise
+            
+            # Run the batch in the background so a slow reply never holds up the next one
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _run_batch(self, batch: list):
+        """Send a batch of requests over the shared connection pool."""
+        results = await asyncio.gather(
+            *(self.client.chat.completions.create(**request) for request, _ in batch),
+            return_exceptions=True
+        )
         
-        if self.api_key:
-            self.client = Groq(api_key=self.api_key)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    def _fail_pending(self, batch: list):
+        """Fail the callers of requests that will never be sent."""
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError("Groq client closed"))
+    
+    async def close(self):
+        """Stop the dispatcher, settle outstanding requests and close the connection pool."""
+        if self._dispatcher_task is not None:
+            self._dispatcher_task.cancel()
+            try:
+                await self._dispatcher_task
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher_task = None
+        
+        # Batches already sent finish normally so their callers still get a reply
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        
+        if self._queue is not None:
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            self._fail_pending(pending)
+            self._queue = None
+        
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self.client = None
     
     async def chat_completion(
         self, 
         messages: list, 
         temperature: float = 0.7,
-        max_tokens: int = 1000,
-        stream: bool = False
-    ) -> Optional[Dict[str, Any]]:
+        max_tokens: int = 1000
+    ) -> Optional[str]:
         """
         Send a chat completion request to Groq API.
         
@@ -28,68 +174,132 @@ class GroqClient:
             messages: List of message dictionaries with 'role' and 'content'
             temperature: Controls randomness (0.0 to 1.0)
             max_tokens: Maximum tokens to generate
-            stream: Whether to stream the response
             
         Returns:
-            API response or None if error
+            Generated message content, or None if the model returned none
+            
+        Raises:
+            Any error from the Groq API, after logging it
         """
-        if not self.client:
+        if not self.api_key:
             raise ValueError("GROQ_API_KEY not configured")
+        if self.client is None:
+            raise RuntimeError("GroqClient.startup() must be awaited before sending requests")
+        
+        cache_key = None
+        if temperature <= CACHEABLE_MAX_TEMPERATURE:
+            cache_key = self._cache_key(messages, max_tokens)
+            cached = self._resp_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
         try:
-            completion = self.client.chat.completions.create(
+            completion = await self._submit(
                 model=self.model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                stream=stream,
                 top_p=1,
                 stop=None
             )
             
-            if stream:
-                # Handle streaming response
-                return self._handle_stream_response(completion)
-            else:
-                # Handle non-streaming response
-                return {
-                    "choices": [{
-                        "message": {
-                            "content": completion.choices[0].message.content
-                        }
-                    }]
-                }
+            content = completion.choices[0].message.content
+            if cache_key is not None and content is not None:
+                self._resp_cache[cache_key] = content
+            return content
                 
         except Exception as e:
-            print(f"Error calling Groq API: {e}")
-            return {"choices": [{"message": {"content": "Error processing request"}}]}
+            # Re-raised so callers never mistake an error for a model reply
+            logger.error("Error calling Groq API: %s", e)
+            raise
     
-    def _handle_stream_response(self, completion) -> Dict[str, Any]:
-        """Handle streaming response from Groq API."""
+    def _cache_key(self, messages: list, max_tokens: int) -> bytes:
+        """Hash the model, token budget and messages into a response cache key."""
+        payload = orjson.dumps([self.model, max_tokens, messages], option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(payload, digest_size=16).digest()
+    
+    async def stream_completion(
+        self, 
+        messages: list, 
+        temperature: float = 0.7,
+        max_tokens: int = 1000
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from Groq API, yielding content deltas.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            temperature: Controls randomness (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate
+            
+        Yields:
+            Text deltas as they are generated
+            
+        Raises:
+            Any error from the Groq API, after logging it
+        """
+        if not self.api_key:
+            raise ValueError("GROQ_API_KEY not configured")
+        if self.client is None:
+            raise RuntimeError("GroqClient.startup() must be awaited before sending requests")
+        
         try:
-            # For now, collect the full response
-            # In a real implementation, you might want to yield chunks
-            full_content = ""
-            for chunk in completion:
-                if chunk.choices[0].delta.content:
-                    full_content += chunk.choices[0].delta.content
+            completion = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                top_p=1,
+                stop=None
+            )
             
-            return {
-                "choices": [{
-                    "message": {
-                        "content": full_content
-                    }
-                }]
-            }
+            async for chunk in completion:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+                    
         except Exception as e:
-            print(f"Error handling stream response: {e}")
-            return {"choices": [{"message": {"content": "Error processing stream response"}}]}
+            # Re-raised so callers can tell a failed stream from a complete reply
+            logger.error("Error streaming from Groq API: %s", e)
+            raise
+    
+    def _build_agent_messages(
+        self, 
+        user_message: str, 
+        context: str,
+        user_profile: Optional[Dict[str, Any]],
+        history: Optional[List[Dict[str, str]]],
+        user_id: Optional[str],
+        profile_version: int
+    ) -> List[Dict[str, str]]:
+        """Build the message list sent to the model for an agent turn."""
+        # Static instructions first (a shared, never-mutated dict), per-request state after
+        messages = [_SYSTEM_MSG]
+        
+        if user_profile:
+            messages.append({
+                "role": "system",
+                "content": f"User profile:\n{_serialize_profile(user_profile, user_id, profile_version)}"
+            })
+        
+        if history:
+            messages.extend(history)
+        
+        if context:
+            messages.append({"role": "system", "content": f"Context:\n{context}"})
+        
+        messages.append({"role": "user", "content": user_message})
+        return messages
     
     async def generate_agent_response(
         self, 
         user_message: str, 
         context: str = "",
-        user_profile: Dict[str, Any] = None
+        user_profile: Dict[str, Any] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        user_id: Optional[str] = None,
+        profile_version: int = 0
     ) -> str:
         """
         Generate an agent response for e-commerce interactions.
@@ -98,39 +308,47 @@ class GroqClient:
             user_message: The user's message
             context: Additional context about the conversation
             user_profile: User profile information from knowledge graph
+            history: Previous conversation turns as role/content messages
+            user_id: Owner of user_profile, used to memoize its serialization
+            profile_version: Version of user_profile from the knowledge graph
             
         Returns:
             Generated response from the agent
+            
+        Raises:
+            RuntimeError: If the model returned no content
         """
-        # Build system prompt for e-commerce agent
-        system_prompt = """You are an AI-powered shopping assistant for an e-commerce platform. 
-        Your role is to help users find products, answer questions, and provide personalized recommendations.
-        
-        Guidelines:
-        - Be helpful, friendly, and professional
-        - Ask clarifying questions when needed
-        - Provide specific product recommendations when possible
-        - Consider user preferences and past behavior
-        - Suggest related products or alternatives
-        """
+        messages = self._build_agent_messages(
+            user_message, context, user_profile, history, user_id, profile_version
+        )
         
-        if context:
-            system_prompt += f"\n\nContext: {context}"
+        response = await self.chat_completion(messages, temperature=settings.GROQ_TEMPERATURE)
         
-        if user_profile:
-            system_prompt += f"\n\nUser Profile: {json.dumps(user_profile, indent=2)}"
-        
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ]
+        if not response:
+            raise RuntimeError("Groq returned an empty response")
+        return response
+    
+    async def stream_agent_response(
+        self, 
+        user_message: str, 
+        context: str = "",
+        user_profile: Dict[str, Any] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        user_id: Optional[str] = None,
+        profile_version: int = 0
+    ) -> AsyncIterator[str]:
+        """
+        Stream an agent response for e-commerce interactions.
         
-        response = await self.chat_completion(messages, temperature=0.7)
+        Takes the same arguments as generate_agent_response and yields the
+        reply as text deltas instead of returning it once complete.
+        """
+        messages = self._build_agent_messages(
+            user_message, context, user_profile, history, user_id, profile_version
+        )
         
-        if response and "choices" in response:
-            return response["choices"][0]["message"]["content"]
-        else:
-            return "I apologize, but I'm having trouble processing your request right now. Please try again later."
+        async for delta in self.stream_completion(messages, temperature=settings.GROQ_TEMPERATURE):
+            yield delta
     
     def is_configured(self) -> bool:
         """Check if the Groq client is properly configured."""
@@ -1,7 +1,11 @@
-from neo4j import GraphDatabase
-from typing import Dict, Any, Optional, List
+import logging
+from cachetools import LRUCache, TTLCache
+from neo4j import AsyncGraphDatabase, RoutingControl
+from typing import Dict, Any, Optional, List, Tuple
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 class KnowledgeGraph:
     """Neo4j knowledge graph for storing user profiles and preferences."""
     
@@ -10,47 +14,85 @@ class KnowledgeGraph:
         self.uri = settings.NEO4J_URI
         self.user = settings.NEO4J_USER
         self.password = settings.NEO4J_PASSWORD
+        self.database = settings.NEO4J_DATABASE
+        # Profiles rarely change; keep them in-process to skip a read per message.
+        # Multi-worker deployments should move this to a shared store (e.g. Redis).
+        self._profile_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+        # Bumped on every write so callers can memoize work derived from a profile
+        self._profile_versions: LRUCache = LRUCache(maxsize=10_000)
     
     async def connect(self):
         """Establish connection to Neo4j database."""
         try:
-            self.driver = GraphDatabase.driver(
+            self.driver = AsyncGraphDatabase.driver(
                 self.uri, 
                 auth=(self.user, self.password)
             )
-            # Test the connection
-            with self.driver.session() as session:
-                session.run("RETURN 1")
-            print("✅ Connected to Neo4j successfully")
+            # Test the connection (fails fast, unlike the retrying execute_query)
+            await self.driver.verify_connectivity()
+            logger.info("Connected to Neo4j successfully")
         except Exception as e:
-            print(f"❌ Failed to connect to Neo4j: {e}")
+            logger.error("Failed to connect to Neo4j: %s", e)
             self.driver = None
+            return
+        
+        await self._create_constraints()
+    
+    async def _create_constraints(self):
+        """Create the uniqueness constraints (and their backing indexes) used by MERGE lookups."""
+        queries = [
+            "CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.user_id IS UNIQUE",
+            "CREATE CONSTRAINT category_name IF NOT EXISTS FOR (c:Category) REQUIRE c.name IS UNIQUE",
+            "CREATE CONSTRAINT preference_value IF NOT EXISTS FOR (p:Preference) REQUIRE p.value IS UNIQUE",
+            "CREATE CONSTRAINT product_id IF NOT EXISTS FOR (p:Product) REQUIRE p.product_id IS UNIQUE"
+        ]
+        
+        # Each constraint is independent: one failing (e.g. on existing duplicates,
+        # or a concurrent worker creating it first) must not skip the others
+        for query in queries:
+            try:
+                await self.driver.execute_query(query, database_=self.database)
+            except Exception as e:
+                logger.warning("Failed to create Neo4j constraint (%s): %s", query, e)
     
     async def close(self):
         """Close the Neo4j connection."""
         if self.driver:
-            self.driver.close()
+            await self.driver.close()
+    
+    def _invalidate_profile(self, user_id: str):
+        """Drop the cached profile and bump its version after a write."""
+        self._profile_cache.pop(user_id, None)
+        self._profile_versions[user_id] = self._profile_versions.get(user_id, 0) + 1
+    
+    def profile_version(self, user_id: str) -> int:
+        """Get the current version counter of a user's profile."""
+        return self._profile_versions.get(user_id, 0)
     
-    def _create_user_profile(self, tx, user_id: str, profile_data: Dict[str, Any]):
+    async def _create_user_profile(self, user_id: str, profile_data: Dict[str, Any]):
         """Create or update user profile in Neo4j."""
         query = """
         MERGE (u:User {user_id: $user_id})
         SET u += $profile_data
         RETURN u
         """
-        result = tx.run(query, user_id=user_id, profile_data=profile_data)
-        return result.single()
+        records, _, _ = await self.driver.execute_query(
+            query, user_id=user_id, profile_data=profile_data, database_=self.database
+        )
+        return records[0] if records else None
     
-    def _get_user_profile(self, tx, user_id: str):
+    async def _get_user_profile(self, user_id: str):
         """Retrieve user profile from Neo4j."""
         query = """
         MATCH (u:User {user_id: $user_id})
         RETURN u
         """
-        result = tx.run(query, user_id=user_id)
-        return result.single()
+        records, _, _ = await self.driver.execute_query(
+            query, user_id=user_id, routing_=RoutingControl.READ, database_=self.database
+        )
+        return records[0] if records else None
     
-    def _add_user_preference(self, tx, user_id: str, category: str, preference: str):
+    async def _add_user_preference(self, user_id: str, category: str, preference: str):
         """Add a user preference to the knowledge graph."""
         query = """
         MATCH (u:User {user_id: $user_id})
@@ -60,100 +102,147 @@ class KnowledgeGraph:
         MERGE (p)-[:BELONGS_TO]->(c)
         RETURN u, c, p
         """
-        result = tx.run(query, user_id=user_id, category=category, preference=preference)
-        return result.data()
+        records, _, _ = await self.driver.execute_query(
+            query, user_id=user_id, category=category, preference=preference, database_=self.database
+        )
+        return [record.data() for record in records]
+    
+    async def _add_user_preferences_batch(self, user_id: str, preferences: List[Tuple[str, str]]):
+        """Add several user preferences to the knowledge graph in one query."""
+        query = """
+        UNWIND $prefs AS row
+        MATCH (u:User {user_id: $user_id})
+        MERGE (c:Category {name: row.category})
+        MERGE (p:Preference {value: row.preference})
+        MERGE (u)-[:LIKES]->(p)
+        MERGE (p)-[:BELONGS_TO]->(c)
+        """
+        prefs = [{"category": category, "preference": preference} for category, preference in preferences]
+        _, summary, _ = await self.driver.execute_query(
+            query, user_id=user_id, prefs=prefs, database_=self.database
+        )
+        return summary
     
-    def _add_purchase_history(self, tx, user_id: str, product_id: str, product_name: str):
+    async def _add_purchase_history(self, user_id: str, product_id: str, product_name: str):
         """Add purchase history to the knowledge graph."""
         query = """
         MATCH (u:User {user_id: $user_id})
-        MERGE (p:Product {product_id: $product_id, name: $product_name})
+        MERGE (p:Product {product_id: $product_id})
+        SET p.name = $product_name
         MERGE (u)-[:PURCHASED]->(p)
         RETURN u, p
         """
-        result = tx.run(query, user_id=user_id, product_id=product_id, product_name=product_name)
-        return result.data()
+        records, _, _ = await self.driver.execute_query(
+            query, user_id=user_id, product_id=product_id, product_name=product_name, database_=self.database
+        )
+        return [record.data() for record in records]
     
     async def create_or_update_user_profile(self, user_id: str, profile_data: Dict[str, Any]) -> bool:
         """Create or update a user profile in the knowledge graph."""
         if not self.driver:
-            print("❌ No Neo4j connection available")
+            logger.warning("No Neo4j connection available")
             return False
         
         try:
-            with self.driver.session() as session:
-                session.execute_write(self._create_user_profile, user_id, profile_data)
-                print(f"✅ User profile created/updated for user: {user_id}")
-                return True
+            await self._create_user_profile(user_id, profile_data)
+            self._invalidate_profile(user_id)
+            logger.debug("User profile created/updated for user %s", user_id)
+            return True
         except Exception as e:
-            print(f"❌ Error creating user profile: {e}")
+            logger.error("Error creating user profile: %s", e)
             return False
     
     async def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve user profile from the knowledge graph."""
         if not self.driver:
-            print("❌ No Neo4j connection available")
+            logger.warning("No Neo4j connection available")
             return None
         
         try:
-            with self.driver.session() as session:
-                result = session.execute_read(self._get_user_profile, user_id)
-                if result:
-                    return dict(result["u"])
-                return None
+            return self._profile_cache[user_id]
+        except KeyError:
+            pass
+        
+        # A write that lands while the read is in flight bumps the version; don't
+        # cache what may be the pre-write profile in that case
+        version = self.profile_version(user_id)
+        try:
+            result = await self._get_user_profile(user_id)
+            profile = dict(result["u"]) if result else None
+            if self.profile_version(user_id) == version:
+                self._profile_cache[user_id] = profile
+            return profile
         except Exception as e:
-            print(f"❌ Error retrieving user profile: {e}")
+            logger.error("Error retrieving user profile: %s", e)
             return None
     
     async def add_user_preference(self, user_id: str, category: str, preference: str) -> bool:
         """Add a user preference to the knowledge graph."""
         if not self.driver:
-            print("❌ No Neo4j connection available")
+            logger.warning("No Neo4j connection available")
             return False
         
         try:
-            with self.driver.session() as session:
-                session.execute_write(self._add_user_preference, user_id, category, preference)
-                print(f"✅ Added preference '{preference}' in category '{category}' for user: {user_id}")
-                return True
+            await self._add_user_preference(user_id, category, preference)
+            self._invalidate_profile(user_id)
+            logger.debug("Added preference %s/%s for user %s", category, preference, user_id)
+            return True
         except Exception as e:
-            print(f"❌ Error adding user preference: {e}")
+            logger.error("Error adding user preference: %s", e)
+            return False
+    
+    async def add_user_preferences_batch(self, user_id: str, preferences: List[Tuple[str, str]]) -> bool:
+        """Add several (category, preference) pairs in a single query."""
+        if not preferences:
+            return True
+        
+        if not self.driver:
+            logger.warning("No Neo4j connection available")
+            return False
+        
+        try:
+            await self._add_user_preferences_batch(user_id, preferences)
+            self._invalidate_profile(user_id)
+            logger.debug("Added %d preference(s) for user %s", len(preferences), user_id)
+            return True
+        except Exception as e:
+            logger.error("Error adding user preferences: %s", e)
             return False
     
     async def add_purchase_history(self, user_id: str, product_id: str, product_name: str) -> bool:
         """Add purchase history to the knowledge graph."""
         if not self.driver:
-            print("❌ No Neo4j connection available")
+            logger.warning("No Neo4j connection available")
             return False
         
         try:
-            with self.driver.session() as session:
-                session.execute_write(self._add_purchase_history, user_id, product_id, product_name)
-                print(f"✅ Added purchase history for product '{product_name}' for user: {user_id}")
-                return True
+            await self._add_purchase_history(user_id, product_id, product_name)
+            logger.debug("Added purchase history for product %s for user %s", product_name, user_id)
+            return True
         except Exception as e:
-            print(f"❌ Error adding purchase history: {e}")
+            logger.error("Error adding purchase history: %s", e)
             return False
     
     async def get_user_recommendations(self, user_id: str) -> List[Dict[str, Any]]:
         """Get personalized recommendations based on user profile and history."""
         if not self.driver:
-            print("❌ No Neo4j connection available")
+            logger.warning("No Neo4j connection available")
             return []
         
         try:
-            with self.driver.session() as session:
-                # This is a placeholder query - in a real implementation,
-                # you would have more sophisticated recommendation logic
-                query = """
-                MATCH (u:User {user_id: $user_id})-[:LIKES]->(p:Preference)-[:BELONGS_TO]->(c:Category)
-                RETURN c.name as category, collect(p.value) as preferences
-                LIMIT 5
-                """
-                result = session.run(query, user_id=user_id)
-                return [record.data() for record in result]
+            # This is a placeholder query - in a real implementation,
+            # you would have more sophisticated recommendation logic
+            query = """
+            MATCH (u:User {user_id: $user_id})-[:LIKES]->(p:Preference)-[:BELONGS_TO]->(c:Category)
+            RETURN c.name as category, collect(p.value) as preferences
+            LIMIT 5
+            """
+            records, _, _ = await self.driver.execute_query(
+                query, user_id=user_id, routing_=RoutingControl.READ, database_=self.database
+            )
+            return [record.data() for record in records]
         except Exception as e:
-            print(f"❌ Error getting recommendations: {e}")
+            logger.error("Error getting recommendations: %s", e)
             return []
     
     def is_connected(self) -> bool:
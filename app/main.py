@@ -1,20 +1,45 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 from typing import Dict, Any, Optional, List
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import secrets
 import uvicorn
 
 from .config import settings
 from .agent import agent
 from .knowledge_graph import knowledge_graph
 from .groq_client import groq_client
-from .serp_api import serp_api
+from .serp_api import serp_api, mock_json
+
+logging.basicConfig(level=logging.INFO)
+# httpx logs each request URL at INFO, and SerpApi URLs carry the API key
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Application lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the agent and SerpApi client on startup, clean up on shutdown."""
+    logger.info("Starting Agent-Powered E-Commerce Application...")
+    # Independent warmups, so startup waits for the slowest rather than the sum
+    await asyncio.gather(agent.initialize(), serp_api.startup())
+    logger.info("Application startup complete")
+    yield
+    logger.info("Shutting down application...")
+    await asyncio.gather(agent.cleanup(), serp_api.aclose())
+    logger.info("Application shutdown complete")
 
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    description="AI-powered e-commerce shopping assistant"
+    description="AI-powered e-commerce shopping assistant",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -27,7 +52,11 @@ app.add_middleware(
 )
 
 # Pydantic models for request/response
-class ChatRequest(BaseModel):
+class _RequestModel(BaseModel):
+    """Base for request bodies: reject unknown fields and keep instances immutable."""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+class ChatRequest(_RequestModel):
     message: str
     user_id: str = "default_user"
     context: str = ""
@@ -40,7 +69,7 @@ class ChatResponse(BaseModel):
     timestamp: str
     error: Optional[str] = None
 
-class UserProfileRequest(BaseModel):
+class UserProfileRequest(_RequestModel):
     user_id: str
     profile_data: Dict[str, Any]
 
@@ -48,80 +77,126 @@ class RecommendationResponse(BaseModel):
     user_id: str
     recommendations: List[Dict[str, Any]]
 
+# Built once so the recommendations list is validated without re-resolving the generic
+_REC_LIST = TypeAdapter(List[Dict[str, Any]])
+
 # Food Ordering Models
-class RestaurantSearchRequest(BaseModel):
+class RestaurantSearchRequest(_RequestModel):
     query: str
     location: str = "New York"
 
-class OrderRequest(BaseModel):
+class OrderItem(BaseModel):
+    # Clients send whole menu items, so unrelated keys are ignored rather than rejected
+    model_config = ConfigDict(frozen=True)
+    
+    id: Optional[str] = None
+    name: Optional[str] = None
+    price: float = 0
+    quantity: int = 1
+
+class OrderRequest(_RequestModel):
     restaurantId: str
-    items: List[Dict[str, Any]]
+    items: List[OrderItem]
     deliveryAddress: str
     paymentMethod: str
 
 # Travel Booking Models
-class FlightSearchRequest(BaseModel):
+class FlightSearchRequest(_RequestModel):
     from_location: str
     to_location: str
     date: str
     passengers: int = 1
 
-class HotelSearchRequest(BaseModel):
+class HotelSearchRequest(_RequestModel):
     location: str
     check_in: str
     check_out: str
     guests: int = 2
 
-class FlightBookingRequest(BaseModel):
+class FlightBookingRequest(_RequestModel):
     flightId: str
     passengers: List[Dict[str, str]]
     paymentMethod: str
 
-class HotelBookingRequest(BaseModel):
+class HotelBookingRequest(_RequestModel):
     hotelId: str
     check_in: str
     check_out: str
     guests: int
     paymentMethod: str
 
+class ItineraryRequest(_RequestModel):
+    flights: List[Dict[str, Any]] = []
+    hotels: List[Dict[str, Any]] = []
+    activities: List[str] = []
+    flights_query: Optional[FlightSearchRequest] = None
+    hotels_query: Optional[HotelSearchRequest] = None
+    activities_query: Optional[str] = None
+
 # Marketplace Models
-class ProductSearchRequest(BaseModel):
+class ProductSearchRequest(_RequestModel):
     query: str
     category: Optional[str] = None
     condition: Optional[str] = None
     min_price: Optional[float] = None
     max_price: Optional[float] = None
 
-class ProductPurchaseRequest(BaseModel):
+class ProductPurchaseRequest(_RequestModel):
     productId: str
     quantity: int
     shippingAddress: str
     paymentMethod: str
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the agent on startup."""
-    print("🚀 Starting Agent-Powered E-Commerce Application...")
-    await agent.initialize()
-    print("✅ Application startup complete!")
-
-# Shutdown event
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up resources on shutdown."""
-    print("🛑 Shutting down application...")
-    await agent.cleanup()
-    print("✅ Application shutdown complete!")
+class ProductListingRequest(_RequestModel):
+    name: str
+    description: str = ""
+    price: float
+    category: str
+    condition: str = "new"
+    image: Optional[str] = None
+
+# Mock data for the demo endpoints; built once at import
+_MOCK_MENU_ITEMS = (
+    {
+        "id": "item_1",
+        "name": "Margherita Pizza",
+        "description": "Fresh mozzarella, tomato sauce, basil",
+        "price": 18.99,
+        "category": "Pizza",
+        "image": "https://via.placeholder.com/200x150?text=Pizza"
+    },
+    {
+        "id": "item_2",
+        "name": "Caesar Salad",
+        "description": "Romaine lettuce, parmesan, croutons",
+        "price": 12.99,
+        "category": "Salad",
+        "image": "https://via.placeholder.com/200x150?text=Salad"
+    },
+)
+
+_MOCK_PRODUCT = {
+    "name": "iPhone 15 Pro",
+    "description": "Latest iPhone with advanced features",
+    "price": 999.99,
+    "category": "Electronics",
+    "condition": "new",
+    "seller": "Apple Store",
+    "image": "https://via.placeholder.com/300x200?text=iPhone+15+Pro"
+}
 
 # Health check endpoint
+_ROOT_INFO = {
+    "app": settings.APP_NAME,
+    "version": settings.APP_VERSION,
+    "status": "running"
+}
+
 @app.get("/")
 async def root():
-    """Root endpoint with basic info."""
+    """Root endpoint with basic info; load balancer probes should use /health."""
     return {
-        "app": settings.APP_NAME,
-        "version": settings.APP_VERSION,
-        "status": "running",
+        **_ROOT_INFO,
         "groq_configured": groq_client.is_configured(),
         "neo4j_connected": knowledge_graph.is_connected()
     }
@@ -148,7 +223,8 @@ async def chat_with_agent(request: ChatRequest):
             context=request.context
         )
         
-        return ChatResponse(**result)
+        # agent.process_message always returns this shape, so skip re-validation
+        return ChatResponse.model_construct(**result)
         
     except Exception as e:
         raise HTTPException(
@@ -156,6 +232,22 @@ async def chat_with_agent(request: ChatRequest):
             detail=f"Error processing message: {str(e)}"
         )
 
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: ChatRequest):
+    """
+    Chat with the AI-powered shopping assistant, streaming the reply.
+    
+    The response body is plain text delivered as the model generates it.
+    """
+    return StreamingResponse(
+        agent.stream_message(
+            user_message=request.message,
+            user_id=request.user_id,
+            context=request.context
+        ),
+        media_type="text/plain"
+    )
+
 # User profile management endpoints
 @app.post("/user/profile")
 async def create_user_profile(request: UserProfileRequest):
@@ -195,16 +287,20 @@ async def get_user_profile(user_id: str):
         )
 
 # Recommendations endpoint
-@app.get("/user/{user_id}/recommendations", response_model=RecommendationResponse)
+@app.get(
+    "/user/{user_id}/recommendations",
+    response_model=None,
+    responses={200: {"model": RecommendationResponse}}
+)
 async def get_user_recommendations(user_id: str):
     """Get personalized recommendations for a user."""
     try:
         recommendations = await agent.get_user_recommendations(user_id)
         
-        return RecommendationResponse(
-            user_id=user_id,
-            recommendations=recommendations
-        )
+        return {
+            "user_id": user_id,
+            "recommendations": _REC_LIST.validate_python(recommendations)
+        }
         
     except Exception as e:
         raise HTTPException(
@@ -214,11 +310,11 @@ async def get_user_recommendations(user_id: str):
 
 # Conversation history endpoint
 @app.get("/conversation/history")
-async def get_conversation_history():
-    """Get the current conversation history."""
+async def get_conversation_history(user_id: str):
+    """Get the conversation history for a user."""
     try:
-        history = agent.get_conversation_history()
-        return {"conversation_history": history}
+        history = agent.get_conversation_history(user_id)
+        return {"user_id": user_id, "conversation_history": history}
         
     except Exception as e:
         raise HTTPException(
@@ -227,11 +323,11 @@ async def get_conversation_history():
         )
 
 @app.delete("/conversation/history")
-async def clear_conversation_history():
-    """Clear the conversation history."""
+async def clear_conversation_history(user_id: str):
+    """Clear the conversation history for a user."""
     try:
-        agent.clear_conversation_history()
-        return {"message": "Conversation history cleared successfully"}
+        agent.clear_conversation_history(user_id)
+        return {"message": "Conversation history cleared successfully", "user_id": user_id}
         
     except Exception as e:
         raise HTTPException(
@@ -241,11 +337,17 @@ async def clear_conversation_history():
 
 # Food Ordering Endpoints
 @app.get("/food/restaurants")
-async def search_restaurants(query: str, location: str = "New York"):
+async def search_restaurants(
+    query: str,
+    location: str = "New York",
+    limit: int = Query(10, ge=1, le=100)
+):
     """Search for restaurants using SerpApi."""
+    if not serp_api.use_live:
+        return Response(content=mock_json("restaurants", limit), media_type="application/json")
     try:
-        restaurants = serp_api.search_restaurants(query, location)
-        return {"restaurants": restaurants}
+        restaurants = await serp_api.search_restaurants(query, location, limit)
+        return ORJSONResponse({"restaurants": restaurants})
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -255,37 +357,19 @@ async def search_restaurants(query: str, location: str = "New York"):
 @app.get("/food/restaurants/{restaurant_id}/menu")
 async def get_restaurant_menu(restaurant_id: str):
     """Get restaurant menu (mock data for demo)."""
-    menu_items = [
-        {
-            "id": "item_1",
-            "name": "Margherita Pizza",
-            "description": "Fresh mozzarella, tomato sauce, basil",
-            "price": 18.99,
-            "category": "Pizza",
-            "image": "https://via.placeholder.com/200x150?text=Pizza"
-        },
-        {
-            "id": "item_2",
-            "name": "Caesar Salad",
-            "description": "Romaine lettuce, parmesan, croutons",
-            "price": 12.99,
-            "category": "Salad",
-            "image": "https://via.placeholder.com/200x150?text=Salad"
-        }
-    ]
-    return {"menu_items": menu_items}
+    return ORJSONResponse({"menu_items": _MOCK_MENU_ITEMS})
 
 @app.post("/food/order")
 async def place_food_order(request: OrderRequest):
     """Place a food order."""
     try:
         # Simulate order processing
-        order_id = f"order_{len(request.items)}_{hash(str(request))}"
+        order_id = f"order_{secrets.token_hex(8)}"
         return {
             "order_id": order_id,
             "status": "confirmed",
             "estimated_delivery": "30-45 minutes",
-            "total": sum(item.get("price", 0) * item.get("quantity", 1) for item in request.items)
+            "total": sum(item.price * item.quantity for item in request.items)
         }
     except Exception as e:
         raise HTTPException(
@@ -299,12 +383,15 @@ async def search_flights(
     from_location: str,
     to_location: str,
     date: str,
-    passengers: int = 1
+    passengers: int = 1,
+    limit: int = Query(10, ge=1, le=100)
 ):
     """Search for flights using SerpApi."""
+    if not serp_api.use_live:
+        return Response(content=mock_json("flights", limit), media_type="application/json")
     try:
-        flights = serp_api.search_flights(from_location, to_location, date)
-        return {"flights": flights}
+        flights = await serp_api.search_flights(from_location, to_location, date, limit)
+        return ORJSONResponse({"flights": flights})
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -316,12 +403,15 @@ async def search_hotels(
     location: str,
     check_in: str,
     check_out: str,
-    guests: int = 2
+    guests: int = 2,
+    limit: int = Query(10, ge=1, le=100)
 ):
     """Search for hotels using SerpApi."""
+    if not serp_api.use_live:
+        return Response(content=mock_json("hotels", limit), media_type="application/json")
     try:
-        hotels = serp_api.search_hotels(location, check_in, check_out)
-        return {"hotels": hotels}
+        hotels = await serp_api.search_hotels(location, check_in, check_out, limit)
+        return ORJSONResponse({"hotels": hotels})
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -332,7 +422,7 @@ async def search_hotels(
 async def book_flight(request: FlightBookingRequest):
     """Book a flight."""
     try:
-        booking_id = f"flight_booking_{hash(str(request))}"
+        booking_id = f"flight_booking_{secrets.token_hex(8)}"
         return {
             "booking_id": booking_id,
             "status": "confirmed",
@@ -349,7 +439,7 @@ async def book_flight(request: FlightBookingRequest):
 async def book_hotel(request: HotelBookingRequest):
     """Book a hotel."""
     try:
-        booking_id = f"hotel_booking_{hash(str(request))}"
+        booking_id = f"hotel_booking_{secrets.token_hex(8)}"
         return {
             "booking_id": booking_id,
             "status": "confirmed",
@@ -365,16 +455,37 @@ async def book_hotel(request: HotelBookingRequest):
         )
 
 @app.post("/travel/itinerary")
-async def create_itinerary(request: Dict[str, Any]):
+async def create_itinerary(request: ItineraryRequest):
     """Create a travel itinerary."""
     try:
-        itinerary_id = f"itinerary_{hash(str(request))}"
+        itinerary_id = f"itinerary_{secrets.token_hex(8)}"
+        
+        # Run any requested searches concurrently rather than one after another
+        searches = {}
+        if request.flights_query:
+            searches["flight_options"] = serp_api.search_flights(
+                request.flights_query.from_location,
+                request.flights_query.to_location,
+                request.flights_query.date
+            )
+        if request.hotels_query:
+            searches["hotel_options"] = serp_api.search_hotels(
+                request.hotels_query.location,
+                request.hotels_query.check_in,
+                request.hotels_query.check_out
+            )
+        if request.activities_query:
+            searches["activity_options"] = serp_api.search_products(request.activities_query, "Activities")
+        
+        results = await asyncio.gather(*searches.values())
+        
         return {
             "itinerary_id": itinerary_id,
             "status": "created",
-            "flights": request.get("flights", []),
-            "hotels": request.get("hotels", []),
-            "activities": request.get("activities", [])
+            "flights": request.flights,
+            "hotels": request.hotels,
+            "activities": request.activities,
+            **dict(zip(searches, results))
         }
     except Exception as e:
         raise HTTPException(
@@ -389,12 +500,15 @@ async def search_products(
     category: Optional[str] = None,
     condition: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    limit: int = Query(10, ge=1, le=100)
 ):
     """Search for products using SerpApi."""
+    if not serp_api.use_live:
+        return Response(content=mock_json("products", limit), media_type="application/json")
     try:
-        products = serp_api.search_products(query or "electronics", category or "General")
-        return {"products": products}
+        products = await serp_api.search_products(query or "electronics", category or "General", limit)
+        return ORJSONResponse({"products": products})
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -406,17 +520,7 @@ async def get_product(product_id: str):
     """Get product details."""
     try:
         # Mock product data
-        product = {
-            "id": product_id,
-            "name": "iPhone 15 Pro",
-            "description": "Latest iPhone with advanced features",
-            "price": 999.99,
-            "category": "Electronics",
-            "condition": "new",
-            "seller": "Apple Store",
-            "image": "https://via.placeholder.com/300x200?text=iPhone+15+Pro"
-        }
-        return product
+        return {"id": product_id, **_MOCK_PRODUCT}
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -427,7 +531,7 @@ async def get_product(product_id: str):
 async def purchase_product(request: ProductPurchaseRequest):
     """Purchase a product."""
     try:
-        purchase_id = f"purchase_{hash(str(request))}"
+        purchase_id = f"purchase_{secrets.token_hex(8)}"
         return {
             "purchase_id": purchase_id,
             "status": "confirmed",
@@ -442,14 +546,14 @@ async def purchase_product(request: ProductPurchaseRequest):
         )
 
 @app.post("/marketplace/sell")
-async def sell_product(request: Dict[str, Any]):
+async def sell_product(request: ProductListingRequest):
     """List a product for sale."""
     try:
-        listing_id = f"listing_{hash(str(request))}"
+        listing_id = f"listing_{secrets.token_hex(8)}"
         return {
             "listing_id": listing_id,
             "status": "active",
-            "product": request
+            "product": request.model_dump(mode="json")
         }
     except Exception as e:
         raise HTTPException(
@@ -464,11 +568,12 @@ async def get_api_docs():
     return {
         "endpoints": {
             "POST /chat": "Chat with the AI shopping assistant",
+            "POST /chat/stream": "Chat with the AI shopping assistant, streaming the reply",
             "POST /user/profile": "Create or update user profile",
             "GET /user/{user_id}/profile": "Get user profile",
             "GET /user/{user_id}/recommendations": "Get personalized recommendations",
-            "GET /conversation/history": "Get conversation history",
-            "DELETE /conversation/history": "Clear conversation history",
+            "GET /conversation/history?user_id={user_id}": "Get a user's conversation history",
+            "DELETE /conversation/history?user_id={user_id}": "Clear a user's conversation history",
             "GET /food/restaurants": "Search restaurants",
             "GET /food/restaurants/{id}/menu": "Get restaurant menu",
             "POST /food/order": "Place food order",
@@ -499,9 +604,16 @@ async def get_api_docs():
 
 # Run the application
 if __name__ == "__main__":
+    # Multiple workers each keep their own in-process caches and histories;
+    # move that state to a shared store (e.g. Redis) before relying on them.
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        # "auto" uses uvloop and httptools when installed (as gunicorn's UvicornWorker does)
+        # and falls back to asyncio/h11 on platforms without them, such as Windows
+        loop="auto",
+        http="auto",
+        workers=1 if settings.DEBUG else settings.WEB_CONCURRENCY
     )
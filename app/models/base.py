@@ -1,5 +1,5 @@
 # Base model for all data models in the application
-from pydantic import BaseModel as PydanticBaseModel
+from pydantic import BaseModel as PydanticBaseModel, ConfigDict
 from typing import Optional
 from datetime import datetime
 
@@ -10,6 +10,6 @@ class BaseModel(PydanticBaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     
-    class Config:
-        # Allow extra fields for flexibility
-        extra = "allow" 
\ No newline at end of file
+    # Build validators on first use rather than at import, since most of
+    # these models are never instantiated
+    model_config = ConfigDict(defer_build=True)
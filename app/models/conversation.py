@@ -14,7 +14,3 @@ class Conversation(BaseModel):
     session_end: Optional[datetime] = None
     intent: Optional[str] = None
     sentiment: Optional[str] = None
-    
-    class Config:
-        # Allow extra fields for flexibility
-        extra = "allow" 
\ No newline at end of file
@@ -16,7 +16,3 @@ class Product(BaseModel):
     availability: bool = True
     rating: Optional[float] = None
     review_count: int = 0
-    
-    class Config:
-        # Allow extra fields for flexibility
-        extra = "allow" 
\ No newline at end of file
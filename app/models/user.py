@@ -12,7 +12,3 @@ class UserProfile(BaseModel):
     budget_range: Optional[str] = None
     purchase_history: List[Dict[str, Any]] = []
     conversation_history: List[Dict[str, str]] = []
-    
-    class Config:
-        # Allow extra fields for flexibility
-        extra = "allow" 
\ No newline at end of file
@@ -1,268 +1,408 @@
-import os
-from typing import Dict, List, Optional, Any
-import json
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Tuple
+from cachetools import TTLCache
+import httpx
+import logging
+import orjson
 from .config import settings
 
-try:
-    from serpapi import GoogleSearch
-    SERP_AVAILABLE = True
-except ImportError:
-    SERP_AVAILABLE = False
-    print("⚠️  Warning: serpapi not installed. Using mock data only.")
+logger = logging.getLogger(__name__)
+
+SERP_API_BASE_URL = "https://serpapi.com"
+
+# Repeated searches within this window are served from memory
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 300
+
+# Upper bound on SerpApi requests in flight at once
+MAX_CONCURRENT_SEARCHES = 20
+
+# Mock data served when no SerpApi key is configured; built once at import
+_MOCK_RESTAURANTS: Tuple[Dict[str, Any], ...] = (
+    {
+        "id": "rest_1",
+        "name": "Pizza Palace",
+        "cuisine": "Pizza",
+        "rating": 4.5,
+        "deliveryTime": "25-35 min",
+        "minOrder": 15,
+        "image": "https://via.placeholder.com/300x200?text=Pizza+Palace"
+    },
+    {
+        "id": "rest_2",
+        "name": "Sushi Express",
+        "cuisine": "Sushi",
+        "rating": 4.3,
+        "deliveryTime": "30-45 min",
+        "minOrder": 20,
+        "image": "https://via.placeholder.com/300x200?text=Sushi+Express"
+    },
+    {
+        "id": "rest_3",
+        "name": "Burger House",
+        "cuisine": "Burgers",
+        "rating": 4.1,
+        "deliveryTime": "20-30 min",
+        "minOrder": 12,
+        "image": "https://via.placeholder.com/300x200?text=Burger+House"
+    },
+)
+
+_MOCK_FLIGHTS: Tuple[Dict[str, Any], ...] = (
+    {
+        "id": "flight_1",
+        "airline": "Delta Airlines",
+        "departure": "JFK",
+        "arrival": "LAX",
+        "departureTime": "10:00 AM",
+        "arrivalTime": "2:00 PM",
+        "price": 299,
+        "duration": "4h 0m"
+    },
+    {
+        "id": "flight_2",
+        "airline": "American Airlines",
+        "departure": "JFK",
+        "arrival": "LAX",
+        "departureTime": "2:00 PM",
+        "arrivalTime": "6:00 PM",
+        "price": 349,
+        "duration": "4h 0m"
+    },
+)
+
+_MOCK_HOTELS: Tuple[Dict[str, Any], ...] = (
+    {
+        "id": "hotel_1",
+        "name": "Grand Hotel",
+        "location": "New York",
+        "rating": 4.5,
+        "price": 200,
+        "amenities": ["WiFi", "Pool", "Gym", "Spa"],
+        "image": "https://via.placeholder.com/300x200?text=Grand+Hotel"
+    },
+    {
+        "id": "hotel_2",
+        "name": "Comfort Inn",
+        "location": "New York",
+        "rating": 4.0,
+        "price": 150,
+        "amenities": ["WiFi", "Breakfast"],
+        "image": "https://via.placeholder.com/300x200?text=Comfort+Inn"
+    },
+)
+
+_MOCK_PRODUCTS: Tuple[Dict[str, Any], ...] = (
+    {
+        "id": "product_1",
+        "name": "iPhone 15 Pro",
+        "description": "Latest iPhone with advanced features",
+        "price": 999.99,
+        "category": "Electronics",
+        "condition": "new",
+        "seller": "Apple Store",
+        "image": "https://via.placeholder.com/300x200?text=iPhone+15+Pro"
+    },
+    {
+        "id": "product_2",
+        "name": "Nike Air Max",
+        "description": "Comfortable running shoes",
+        "price": 129.99,
+        "category": "Fashion",
+        "condition": "new",
+        "seller": "Nike Store",
+        "image": "https://via.placeholder.com/300x200?text=Nike+Air+Max"
+    },
+)
+
+# Failures that fall back to mock data; anything else is a bug and propagates
+SEARCH_ERRORS = (httpx.HTTPError, KeyError, ValueError)
+
+def _describe_error(e: Exception) -> str:
+    """Summarize a search failure for logging without the request URL, which carries the API key."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"{e.__class__.__name__} (status {e.response.status_code})"
+    if isinstance(e, httpx.HTTPError):
+        return e.__class__.__name__
+    return f"{e.__class__.__name__}: {e}"
+
+# Mock responses pre-encoded once so the no-API-key path skips serialization
+MOCK_RESTAURANTS_JSON: bytes = orjson.dumps({"restaurants": _MOCK_RESTAURANTS})
+MOCK_FLIGHTS_JSON: bytes = orjson.dumps({"flights": _MOCK_FLIGHTS})
+MOCK_HOTELS_JSON: bytes = orjson.dumps({"hotels": _MOCK_HOTELS})
+MOCK_PRODUCTS_JSON: bytes = orjson.dumps({"products": _MOCK_PRODUCTS})
+
+_MOCK_RESULTS = {
+    "restaurants": (_MOCK_RESTAURANTS, MOCK_RESTAURANTS_JSON),
+    "flights": (_MOCK_FLIGHTS, MOCK_FLIGHTS_JSON),
+    "hotels": (_MOCK_HOTELS, MOCK_HOTELS_JSON),
+    "products": (_MOCK_PRODUCTS, MOCK_PRODUCTS_JSON)
+}
+
+def mock_json(kind: str, limit: int) -> bytes:
+    """Encoded mock response for kind, truncated to limit rows like a live search."""
+    rows, encoded = _MOCK_RESULTS[kind]
+    if limit >= len(rows):
+        return encoded
+    return orjson.dumps({kind: rows[:limit]})
 
 class SerpApiService:
     def __init__(self):
         self.api_key = settings.SERP_API_KEY
-        if not self.api_key:
-            print("⚠️  Warning: SERP_API_KEY not found in environment variables")
-            print("   Some features will use mock data")
+        self._use_live = bool(self.api_key)
+        # Created in startup(), once the serving event loop is running
+        self._client: Optional[httpx.AsyncClient] = None
+        # Also built in startup(): before Python 3.10 a semaphore binds to the
+        # event loop that is current when it is constructed
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._restaurant_cache: TTLCache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+        self._flight_cache: TTLCache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+        self._hotel_cache: TTLCache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+        self._product_cache: TTLCache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+        # Constant query parameters per engine, merged with call-specific ones
+        self._restaurant_params: Dict[str, Any] = {"engine": "google", "api_key": self.api_key}
+        self._flight_params: Dict[str, Any] = {
+            "engine": "google_flights",
+            "api_key": self.api_key,
+            "return_date": "",
+            "adults": 1,
+            "children": 0,
+            "infants": 0,
+            "currency": "USD"
+        }
+        self._hotel_params: Dict[str, Any] = {
+            "engine": "google_hotels",
+            "api_key": self.api_key,
+            "adults": 2,
+            "children": 0,
+            "currency": "USD"
+        }
+        self._product_params: Dict[str, Any] = {"engine": "google_shopping", "api_key": self.api_key}
+        # Fetches in flight, so concurrent identical misses share one request
+        self._inflight: Dict[Tuple[int, Tuple], asyncio.Task] = {}
+        if not self._use_live:
+            logger.warning("SERP_API_KEY not found in environment variables; some features will use mock data")
     
-    def search_restaurants(self, query: str, location: str = "New York") -> List[Dict]:
-        """Search for restaurants using Google Search API"""
-        if not self.api_key:
-            return self._get_mock_restaurants()
-        
+    @property
+    def use_live(self) -> bool:
+        """Whether searches go to SerpApi rather than returning mock data."""
+        return self._use_live
+    
+    async def startup(self):
+        """Create the shared HTTP client and concurrency limit used for SerpApi requests."""
+        self._client = httpx.AsyncClient(
+            base_url=SERP_API_BASE_URL,
+            http2=True,
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100)
+        )
+        self._sem = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+    
+    async def aclose(self):
+        """Close the shared HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._sem = None
+    
+    async def _search(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a SerpApi search and return the decoded JSON response."""
+        if self._client is None or self._sem is None:
+            raise RuntimeError("SerpApiService.startup() must be awaited before running live searches")
+        async with self._sem:
+            response = await self._client.get("/search", params=params)
+        response.raise_for_status()
+        return response.json()
+    
+    async def _cached(
+        self,
+        cache: TTLCache,
+        key: Tuple,
+        fetch: Callable[[], Awaitable[List[Dict]]]
+    ) -> List[Dict]:
+        """Return a cached result, or fetch it once for all concurrent callers."""
         try:
-            search = GoogleSearch({
-                "q": f"{query} restaurants {location}",
-                "api_key": self.api_key,
-                "engine": "google",
-                "num": 10
-            })
-            results = search.get_dict()
+            return cache[key]
+        except KeyError:
+            pass
+        
+        inflight_key = (id(cache), key)
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            self._inflight[inflight_key] = task
             
-            restaurants = []
-            if "organic_results" in results:
-                for result in results["organic_results"][:10]:
-                    restaurants.append({
-                        "id": result.get("position", 0),
-                        "name": result.get("title", "").split(" - ")[0],
-                        "cuisine": query,
-                        "rating": 4.2,  # Mock rating
-                        "deliveryTime": "25-35 min",
-                        "minOrder": 15,
-                        "image": "https://via.placeholder.com/300x200?text=Restaurant",
-                        "address": result.get("snippet", ""),
-                        "website": result.get("link", "")
-                    })
+            def _done(t: asyncio.Task):
+                self._inflight.pop(inflight_key, None)
+                if not t.cancelled() and t.exception() is None:
+                    cache[key] = t.result()
             
-            return restaurants
-        except Exception as e:
-            print(f"Error searching restaurants: {e}")
-            return self._get_mock_restaurants()
+            task.add_done_callback(_done)
+        
+        # Shielded so one caller going away does not cancel the shared fetch
+        return await asyncio.shield(task)
+    
+    async def search_restaurants(self, query: str, location: str = "New York", limit: int = 10) -> List[Dict]:
+        """Search for restaurants using Google Search API"""
+        if not self.use_live:
+            return self._get_mock_restaurants(limit)
+        
+        try:
+            key = (query.lower().strip(), location.lower().strip(), limit)
+            return await self._cached(self._restaurant_cache, key, lambda: self._fetch_restaurants(query, location, limit))
+        except SEARCH_ERRORS as e:
+            logger.error("Error searching restaurants: %s", _describe_error(e))
+            return self._get_mock_restaurants(limit)
+    
+    async def _fetch_restaurants(self, query: str, location: str, limit: int) -> List[Dict]:
+        """Fetch restaurants from SerpApi, raising on failure."""
+        results = await self._search({
+            **self._restaurant_params,
+            "q": f"{query} restaurants {location}",
+            "num": limit
+        })
+        
+        restaurants = []
+        if "organic_results" in results:
+            for result in results["organic_results"][:limit]:
+                restaurants.append({
+                    "id": result.get("position", 0),
+                    "name": result.get("title", "").split(" - ")[0],
+                    "cuisine": query,
+                    "rating": 4.2,  # Mock rating
+                    "deliveryTime": "25-35 min",
+                    "minOrder": 15,
+                    "image": "https://via.placeholder.com/300x200?text=Restaurant",
+                    "address": result.get("snippet", ""),
+                    "website": result.get("link", "")
+                })
+        
+        return restaurants
     
-    def search_flights(self, from_location: str, to_location: str, date: str) -> List[Dict]:
+    async def search_flights(self, from_location: str, to_location: str, date: str, limit: int = 10) -> List[Dict]:
         """Search for flights using Google Flights API"""
-        if not self.api_key:
-            return self._get_mock_flights()
+        if not self.use_live:
+            return self._get_mock_flights(limit)
         
         try:
-            search = GoogleSearch({
-                "engine": "google_flights",
-                "api_key": self.api_key,
-                "departure_id": from_location,
-                "arrival_id": to_location,
-                "outbound_date": date,
-                "return_date": "",
-                "adults": 1,
-                "children": 0,
-                "infants": 0,
-                "currency": "USD"
-            })
-            results = search.get_dict()
-            
-            flights = []
-            if "flights_results" in results:
-                for flight in results["flights_results"][:10]:
-                    flights.append({
-                        "id": flight.get("flight_id", "flight_1"),
-                        "airline": flight.get("airline", "Unknown"),
-                        "departure": from_location,
-                        "arrival": to_location,
-                        "departureTime": flight.get("departure_time", "10:00 AM"),
-                        "arrivalTime": flight.get("arrival_time", "2:00 PM"),
-                        "price": flight.get("price", 299),
-                        "duration": flight.get("duration", "4h 0m")
-                    })
-            
-            return flights
-        except Exception as e:
-            print(f"Error searching flights: {e}")
-            return self._get_mock_flights()
+            key = (from_location.lower().strip(), to_location.lower().strip(), date.strip(), limit)
+            return await self._cached(self._flight_cache, key, lambda: self._fetch_flights(from_location, to_location, date, limit))
+        except SEARCH_ERRORS as e:
+            logger.error("Error searching flights: %s", _describe_error(e))
+            return self._get_mock_flights(limit)
+    
+    async def _fetch_flights(self, from_location: str, to_location: str, date: str, limit: int) -> List[Dict]:
+        """Fetch flights from SerpApi, raising on failure."""
+        results = await self._search({
+            **self._flight_params,
+            "departure_id": from_location,
+            "arrival_id": to_location,
+            "outbound_date": date
+        })
+        
+        flights = []
+        if "flights_results" in results:
+            for flight in results["flights_results"][:limit]:
+                flights.append({
+                    "id": flight.get("flight_id", "flight_1"),
+                    "airline": flight.get("airline", "Unknown"),
+                    "departure": from_location,
+                    "arrival": to_location,
+                    "departureTime": flight.get("departure_time", "10:00 AM"),
+                    "arrivalTime": flight.get("arrival_time", "2:00 PM"),
+                    "price": flight.get("price", 299),
+                    "duration": flight.get("duration", "4h 0m")
+                })
+        
+        return flights
     
-    def search_hotels(self, location: str, check_in: str, check_out: str) -> List[Dict]:
+    async def search_hotels(self, location: str, check_in: str, check_out: str, limit: int = 10) -> List[Dict]:
         """Search for hotels using Google Hotels API"""
-        if not self.api_key:
-            return self._get_mock_hotels()
+        if not self.use_live:
+            return self._get_mock_hotels(limit)
         
         try:
-            search = GoogleSearch({
-                "engine": "google_hotels",
-                "api_key": self.api_key,
-                "q": f"hotels in {location}",
-                "check_in": check_in,
-                "check_out": check_out,
-                "adults": 2,
-                "children": 0,
-                "currency": "USD"
-            })
-            results = search.get_dict()
-            
-            hotels = []
-            if "hotels_results" in results:
-                for hotel in results["hotels_results"][:10]:
-                    hotels.append({
-                        "id": hotel.get("hotel_id", "hotel_1"),
-                        "name": hotel.get("title", "Hotel Name"),
-                        "location": location,
-                        "rating": hotel.get("rating", 4.0),
-                        "price": hotel.get("price", 150),
-                        "amenities": ["WiFi", "Pool", "Gym"],
-                        "image": "https://via.placeholder.com/300x200?text=Hotel"
-                    })
-            
-            return hotels
-        except Exception as e:
-            print(f"Error searching hotels: {e}")
-            return self._get_mock_hotels()
+            key = (location.lower().strip(), check_in.strip(), check_out.strip(), limit)
+            return await self._cached(self._hotel_cache, key, lambda: self._fetch_hotels(location, check_in, check_out, limit))
+        except SEARCH_ERRORS as e:
+            logger.error("Error searching hotels: %s", _describe_error(e))
+            return self._get_mock_hotels(limit)
+    
+    async def _fetch_hotels(self, location: str, check_in: str, check_out: str, limit: int) -> List[Dict]:
+        """Fetch hotels from SerpApi, raising on failure."""
+        results = await self._search({
+            **self._hotel_params,
+            "q": f"hotels in {location}",
+            "check_in": check_in,
+            "check_out": check_out
+        })
+        
+        hotels = []
+        if "hotels_results" in results:
+            for hotel in results["hotels_results"][:limit]:
+                hotels.append({
+                    "id": hotel.get("hotel_id", "hotel_1"),
+                    "name": hotel.get("title", "Hotel Name"),
+                    "location": location,
+                    "rating": hotel.get("rating", 4.0),
+                    "price": hotel.get("price", 150),
+                    "amenities": ["WiFi", "Pool", "Gym"],
+                    "image": "https://via.placeholder.com/300x200?text=Hotel"
+                })
+        
+        return hotels
     
-    def search_products(self, query: str, category: str = None) -> List[Dict]:
+    async def search_products(self, query: str, category: str = None, limit: int = 10) -> List[Dict]:
         """Search for products using Google Shopping API"""
-        if not self.api_key:
-            return self._get_mock_products()
+        if not self.use_live:
+            return self._get_mock_products(limit)
         
         try:
-            search = GoogleSearch({
-                "engine": "google_shopping",
-                "api_key": self.api_key,
-                "q": query,
-                "num": 20
-            })
-            results = search.get_dict()
-            
-            products = []
-            if "shopping_results" in results:
-                for product in results["shopping_results"][:10]:
-                    products.append({
-                        "id": product.get("product_id", "product_1"),
-                        "name": product.get("title", "Product Name"),
-                        "description": product.get("description", "Product description"),
-                        "price": product.get("price", 99.99),
-                        "category": category or "General",
-                        "condition": "new",
-                        "seller": "Online Store",
-                        "image": product.get("thumbnail", "https://via.placeholder.com/300x200?text=Product")
-                    })
-            
-            return products
-        except Exception as e:
-            print(f"Error searching products: {e}")
-            return self._get_mock_products()
+            key = (query.lower().strip(), category, limit)
+            return await self._cached(self._product_cache, key, lambda: self._fetch_products(query, category, limit))
+        except SEARCH_ERRORS as e:
+            logger.error("Error searching products: %s", _describe_error(e))
+            return self._get_mock_products(limit)
+    
+    async def _fetch_products(self, query: str, category: str, limit: int) -> List[Dict]:
+        """Fetch products from SerpApi, raising on failure."""
+        results = await self._search({
+            **self._product_params,
+            "q": query,
+            "num": limit
+        })
+        
+        products = []
+        if "shopping_results" in results:
+            for product in results["shopping_results"][:limit]:
+                products.append({
+                    "id": product.get("product_id", "product_1"),
+                    "name": product.get("title", "Product Name"),
+                    "description": product.get("description", "Product description"),
+                    "price": product.get("price", 99.99),
+                    "category": category or "General",
+                    "condition": "new",
+                    "seller": "Online Store",
+                    "image": product.get("thumbnail", "https://via.placeholder.com/300x200?text=Product")
+                })
+        
+        return products
     
-    def _get_mock_restaurants(self) -> List[Dict]:
+    def _get_mock_restaurants(self, limit: int = 10) -> List[Dict]:
         """Mock restaurant data for demo"""
-        return [
-            {
-                "id": "rest_1",
-                "name": "Pizza Palace",
-                "cuisine": "Pizza",
-                "rating": 4.5,
-                "deliveryTime": "25-35 min",
-                "minOrder": 15,
-                "image": "https://via.placeholder.com/300x200?text=Pizza+Palace"
-            },
-            {
-                "id": "rest_2", 
-                "name": "Sushi Express",
-                "cuisine": "Sushi",
-                "rating": 4.3,
-                "deliveryTime": "30-45 min",
-                "minOrder": 20,
-                "image": "https://via.placeholder.com/300x200?text=Sushi+Express"
-            },
-            {
-                "id": "rest_3",
-                "name": "Burger House",
-                "cuisine": "Burgers", 
-                "rating": 4.1,
-                "deliveryTime": "20-30 min",
-                "minOrder": 12,
-                "image": "https://via.placeholder.com/300x200?text=Burger+House"
-            }
-        ]
+        return list(_MOCK_RESTAURANTS[:limit])
     
-    def _get_mock_flights(self) -> List[Dict]:
+    def _get_mock_flights(self, limit: int = 10) -> List[Dict]:
         """Mock flight data for demo"""
-        return [
-            {
-                "id": "flight_1",
-                "airline": "Delta Airlines",
-                "departure": "JFK",
-                "arrival": "LAX", 
-                "departureTime": "10:00 AM",
-                "arrivalTime": "2:00 PM",
-                "price": 299,
-                "duration": "4h 0m"
-            },
-            {
-                "id": "flight_2",
-                "airline": "American Airlines",
-                "departure": "JFK",
-                "arrival": "LAX",
-                "departureTime": "2:00 PM", 
-                "arrivalTime": "6:00 PM",
-                "price": 349,
-                "duration": "4h 0m"
-            }
-        ]
+        return list(_MOCK_FLIGHTS[:limit])
     
-    def _get_mock_hotels(self) -> List[Dict]:
+    def _get_mock_hotels(self, limit: int = 10) -> List[Dict]:
         """Mock hotel data for demo"""
-        return [
-            {
-                "id": "hotel_1",
-                "name": "Grand Hotel",
-                "location": "New York",
-                "rating": 4.5,
-                "price": 200,
-                "amenities": ["WiFi", "Pool", "Gym", "Spa"],
-                "image": "https://via.placeholder.com/300x200?text=Grand+Hotel"
-            },
-            {
-                "id": "hotel_2",
-                "name": "Comfort Inn",
-                "location": "New York", 
-                "rating": 4.0,
-                "price": 150,
-                "amenities": ["WiFi", "Breakfast"],
-                "image": "https://via.placeholder.com/300x200?text=Comfort+Inn"
-            }
-        ]
+        return list(_MOCK_HOTELS[:limit])
     
-    def _get_mock_products(self) -> List[Dict]:
+    def _get_mock_products(self, limit: int = 10) -> List[Dict]:
         """Mock product data for demo"""
-        return [
-            {
-                "id": "product_1",
-                "name": "iPhone 15 Pro",
-                "description": "Latest iPhone with advanced features",
-                "price": 999.99,
-                "category": "Electronics",
-                "condition": "new",
-                "seller": "Apple Store",
-                "image": "https://via.placeholder.com/300x200?text=iPhone+15+Pro"
-            },
-            {
-                "id": "product_2",
-                "name": "Nike Air Max",
-                "description": "Comfortable running shoes",
-                "price": 129.99,
-                "category": "Fashion",
-                "condition": "new", 
-                "seller": "Nike Store",
-                "image": "https://via.placeholder.com/300x200?text=Nike+Air+Max"
-            }
-        ]
+        return list(_MOCK_PRODUCTS[:limit])
 
 # Initialize the service
 serp_api = SerpApiService() 
\ No newline at end of file
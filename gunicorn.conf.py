@@ -0,0 +1,14 @@
+# Gunicorn configuration for running the app behind Uvicorn workers
+# Usage: gunicorn app.main:app -c gunicorn.conf.py
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# UvicornWorker picks uvloop and httptools automatically; both ship with uvicorn[standard]
+worker_class = "uvicorn.workers.UvicornWorker"
+# Each worker keeps its own in-process caches and conversation histories, so a
+# follow-up request can land on a worker that has never seen the user. Stay on
+# one worker (the same default as python -m app.main) until that state lives in
+# a shared store (e.g. Redis); then 2 x CPU + 1 is a reasonable WEB_CONCURRENCY.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+keepalive = 5
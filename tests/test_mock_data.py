@@ -0,0 +1,57 @@
+"""Guard the hoisted mock data against accidental shape changes."""
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app import serp_api as serp_module
+from app.main import app, _MOCK_MENU_ITEMS, _MOCK_PRODUCT
+from app.serp_api import serp_api, mock_json
+
+# Key sets of the literal mock dicts these constants replaced
+RESTAURANT_KEYS = {"id", "name", "cuisine", "rating", "deliveryTime", "minOrder", "image"}
+FLIGHT_KEYS = {"id", "airline", "departure", "arrival", "departureTime", "arrivalTime", "price", "duration"}
+HOTEL_KEYS = {"id", "name", "location", "rating", "price", "amenities", "image"}
+PRODUCT_KEYS = {"id", "name", "description", "price", "category", "condition", "seller", "image"}
+MENU_ITEM_KEYS = {"id", "name", "description", "price", "category", "image"}
+
+MOCKS = [
+    ("restaurants", serp_module._MOCK_RESTAURANTS, RESTAURANT_KEYS, 3),
+    ("flights", serp_module._MOCK_FLIGHTS, FLIGHT_KEYS, 2),
+    ("hotels", serp_module._MOCK_HOTELS, HOTEL_KEYS, 2),
+    ("products", serp_module._MOCK_PRODUCTS, PRODUCT_KEYS, 2),
+]
+
+
+@pytest.mark.parametrize("kind, rows, keys, count", MOCKS)
+def test_mock_rows_keep_their_keys(kind, rows, keys, count):
+    assert len(rows) == count
+    for row in rows:
+        assert set(row) == keys
+
+
+@pytest.mark.parametrize("kind, rows, keys, count", MOCKS)
+def test_mock_json_matches_rows(kind, rows, keys, count):
+    assert mock_json(kind, 10) == orjson.dumps({kind: rows})
+    assert orjson.loads(mock_json(kind, 1)) == {kind: [rows[0]]}
+
+
+@pytest.mark.parametrize("kind, rows, keys, count", MOCKS)
+def test_get_mock_returns_a_fresh_sliced_list(kind, rows, keys, count):
+    getter = getattr(serp_api, f"_get_mock_{kind}")
+    result = getter()
+    assert result == list(rows)
+    result.clear()
+    assert getter(1) == [rows[0]]
+
+
+def test_menu_items_keep_their_keys():
+    assert len(_MOCK_MENU_ITEMS) == 2
+    for item in _MOCK_MENU_ITEMS:
+        assert set(item) == MENU_ITEM_KEYS
+
+
+def test_product_endpoint_keeps_its_keys():
+    assert set(_MOCK_PRODUCT) == PRODUCT_KEYS - {"id"}
+    response = TestClient(app).get("/marketplace/products/p42")
+    assert response.status_code == 200
+    assert response.json() == {"id": "p42", **_MOCK_PRODUCT}